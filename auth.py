@@ -1,7 +1,12 @@
-from datetime import datetime, timedelta, timezone
+import hmac
+import time
+from datetime import timedelta
 from typing import Optional
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+import bcrypt
+import jwt
+from cachetools import TTLCache
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from database import Admin
 import os
@@ -10,24 +15,38 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 # JWT configuration
 SECRET_KEY = os.getenv("SECRET_KEY")  # In production, use a secure randomly generated key loaded from environment
+ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
+if not SECRET_KEY or not ADMIN_PASSWORD:
+    raise RuntimeError("SECRET_KEY and ADMIN_PASSWORD must be set in the environment")
+_SECRET_BYTES = SECRET_KEY.encode()
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (bcrypt cost factor, tunable via environment)
+_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 
 # Setup bearer token authentication
 security = HTTPBearer()
 
+# Recently verified tokens -> decoded payload. JWTs are self-authenticating, so a token that
+# verified once stays valid until its exp, which is re-checked on every hit.
+_verified_tokens = TTLCache(maxsize=4096, ttl=int(os.getenv("TOKEN_CACHE_TTL", "300")))
+
+def constant_time_eq(a: str, b: str) -> bool:
+    """Compare two secrets/identifiers without leaking the matching prefix length via timing"""
+    return hmac.compare_digest(a.encode(), b.encode())
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=_ROUNDS)).decode()
 
 def authenticate_admin(db: Session, username: str, password: str):
+    # Called from a sync route handler, which FastAPI already runs in a worker thread,
+    # so the CPU-bound bcrypt check doesn't block the event loop
     admin = db.query(Admin).filter(Admin.username == username).first()
-    if not admin:
+    if not admin or not constant_time_eq(admin.username, username):
         return False
     if not verify_password(password, admin.password_hash):
         return False
@@ -35,12 +54,10 @@ def authenticate_admin(db: Session, username: str, password: str):
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
-    else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    if expires_delta is None:
+        expires_delta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode["exp"] = int(time.time() + expires_delta.total_seconds())
+    encoded_jwt = jwt.encode(to_encode, _SECRET_BYTES, algorithm=ALGORITHM)
     return encoded_jwt
 
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
@@ -50,26 +67,38 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    token = credentials.credentials
+    payload = _verified_tokens.get(token)
+    if payload is not None:
+        if payload.get("exp", 0) > time.time():
+            return payload
+        _verified_tokens.pop(token, None)
+
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, _SECRET_BYTES, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-    except JWTError:
+    except jwt.PyJWTError:
         raise credentials_exception
         
+    _verified_tokens[token] = payload
     return payload
 
 def init_admin(db: Session):
     """Initialize a default admin if none exists"""
-    admin_exists = db.query(Admin).filter(Admin.username == "admin").first()
-    if not admin_exists:
-        admin = Admin(
-            username="admin", 
-            password_hash=get_password_hash(os.getenv("ADMIN_PASSWORD"))
-        )
-        db.add(admin)
+    # Cheap existence probe, so the usual restart neither loads a row nor hashes a password
+    if db.execute(select(Admin.id).limit(1)).first() is not None:
+        return None
+    admin = Admin(
+        username="admin", 
+        password_hash=get_password_hash(ADMIN_PASSWORD)
+    )
+    db.add(admin)
+    try:
         db.commit()
-        db.refresh(admin)
-        return admin
-    return admin_exists 
\ No newline at end of file
+    except IntegrityError:
+        # Another process created it between the probe and the insert
+        db.rollback()
+        return None
+    return admin
\ No newline at end of file
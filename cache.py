@@ -0,0 +1,25 @@
+from threading import Lock
+import os
+from cachetools import TTLCache
+
+# Short-lived in-process cache for id-keyed reads, keyed by (kind, id),
+# e.g. ("product", 1). Entries are invalidated by the write handlers and
+# otherwise expire after CACHE_TTL seconds.
+_cache = TTLCache(
+    maxsize=int(os.getenv("CACHE_MAXSIZE", "4096")),
+    ttl=int(os.getenv("CACHE_TTL", "30")),
+)
+_lock = Lock()
+
+def cache_get(key):
+    with _lock:
+        return _cache.get(key)
+
+def cache_set(key, value):
+    with _lock:
+        _cache[key] = value
+
+def cache_invalidate(*keys):
+    with _lock:
+        for key in keys:
+            _cache.pop(key, None)
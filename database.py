@@ -1,10 +1,11 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, ForeignKey, DateTime
+from sqlalchemy import create_engine, make_url, event, func, true, insert, inspect, select, text, Index, Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Table
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import StaticPool
 import os
 from dotenv import load_dotenv
 import uuid
-from datetime import datetime
+import json
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,18 +13,68 @@ load_dotenv()
 # Get database URL from environment variable, default to SQLite if not set
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./justreats.db")
 
+# Size of the compiled-statement cache shared by all connections of the engine
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1200"))
+
+# Connection pool sizing, per worker process: with one worker per core the database sees up
+# to workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections, so keep that under its
+# max_connections (100 by default on Postgres)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
 # Configure engine based on database type
-if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+_url = make_url(SQLALCHEMY_DATABASE_URL)
+if _url.get_backend_name() == "sqlite":
+    # "sqlite://", ":memory:" and mode=memory URIs all name in-memory databases
+    if _url.database in (None, "", ":memory:") or _url.query.get("mode") == "memory":
+        # An in-memory database only exists on its one connection, so share it
+        pool_args = {"poolclass": StaticPool}
+    else:
+        # A local SQLite connection never goes stale, so no pre-ping or recycling
+        pool_args = {"pool_size": POOL_SIZE, "max_overflow": MAX_OVERFLOW}
     engine = create_engine(
-        SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        query_cache_size=QUERY_CACHE_SIZE,
+        **pool_args,
     )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers proceed while a writer holds the lock; busy_timeout
+        # makes writers wait instead of failing with "database is locked"
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
 else:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    # Server connections can be dropped underneath us: recycle them and check before use
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        query_cache_size=QUERY_CACHE_SIZE,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=POOL_RECYCLE,
+    )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay loaded after commit, so handlers can serialize them without a reload
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 Base = declarative_base()
 
+# Links products to the addons that can be applied to them
+product_addon = Table(
+    "product_addon",
+    Base.metadata,
+    Column("product_id", Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True),
+    Column("addon_id", Integer, ForeignKey("addons.id", ondelete="CASCADE"), primary_key=True, index=True),
+)
+
 class Product(Base):
     __tablename__ = "products"
 
@@ -32,12 +83,20 @@ class Product(Base):
     description = Column(String)
     price = Column(Float)
     image = Column(String)
-    available = Column(Boolean, default=True)
+    available = Column(Boolean, default=True, index=True)
     eventOnly = Column(Boolean, default=False)
     eventId = Column(Integer, nullable=True)
 
-    # For storing applicableAddons as a JSON string
-    applicableAddons = Column(String)
+    # Partial index covering the storefront listing (available rows, keyset-ordered by id)
+    __table_args__ = (
+        Index(
+            "ix_products_available_id", available, id,
+            sqlite_where=available == true(),
+            postgresql_where=available == true(),
+        ),
+    )
+
+    addons = relationship("Addon", secondary=product_addon, back_populates="products", lazy="selectin")
 
 class Addon(Base):
     __tablename__ = "addons"
@@ -47,9 +106,8 @@ class Addon(Base):
     description = Column(String)
     price = Column(Float)
     available = Column(Boolean, default=True)
-    
-    # For storing applicableProducts as a JSON string
-    applicableProducts = Column(String)
+
+    products = relationship("Product", secondary=product_addon, back_populates="addons", lazy="selectin")
 
 class Event(Base):
     __tablename__ = "events"
@@ -61,8 +119,8 @@ class Event(Base):
     endDate = Column(DateTime)
     location = Column(String)
     image = Column(String)
-    active = Column(Boolean, default=True)
-    featured = Column(Boolean, default=False)
+    active = Column(Boolean, default=True, index=True)
+    featured = Column(Boolean, default=False, index=True)
 
 class Banner(Base):
     __tablename__ = "banners"
@@ -92,7 +150,7 @@ class Order(Base):
     __tablename__ = "orders"
 
     id = Column(Integer, primary_key=True, index=True)
-    date = Column(DateTime, default=datetime.now)
+    date = Column(DateTime(timezone=True), server_default=func.now())
     unique_order_id = Column(String, unique=True, index=True)
     items = Column(String)  # JSON string of ordered items
     customer = Column(String)  # JSON string of customer information
@@ -101,11 +159,95 @@ class Order(Base):
 
     def generate_unique_id(self):
         # Generate a unique ID using a combination of random letters and numbers
-        self.unique_order_id = str(uuid.uuid4()).replace("-", "")[:12]  # 12 characters long
+        self.unique_order_id = uuid.uuid4().hex[:12]  # 12 characters long
 
 
-def init_db():
+def create_schema():
     Base.metadata.create_all(bind=engine)
+    # create_all only indexes tables it creates; add indexes introduced since to existing tables
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def init_db():
+    create_schema()
+    if legacy_link_columns():
+        raise RuntimeError(
+            "Legacy applicableAddons/applicableProducts columns found; "
+            "run `python database.py migrate` once before starting the app"
+        )
+
+# Legacy JSON id-list columns replaced by product_addon: (table, column, own key, other key)
+_LEGACY_LINK_COLUMNS = [
+    ("products", "applicableAddons", "product_id", "addon_id"),
+    ("addons", "applicableProducts", "addon_id", "product_id"),
+]
+
+def legacy_link_columns():
+    inspector = inspect(engine)
+    return [
+        legacy for legacy in _LEGACY_LINK_COLUMNS
+        if legacy[1] in {c["name"] for c in inspector.get_columns(legacy[0])}
+    ]
+
+def migrate_applicable_json():
+    """One-shot migration of the legacy JSON applicableAddons/applicableProducts columns
+    into product_addon rows; the legacy columns are dropped once copied.
+    Irreversible, so it runs from `python database.py migrate` rather than at startup."""
+    legacy = legacy_link_columns()
+    if not legacy:
+        return
+    with engine.begin() as connection:
+        if connection.dialect.name == "sqlite" and connection.dialect.server_version_info < (3, 35):
+            version = ".".join(map(str, connection.dialect.server_version_info))
+            raise RuntimeError(f"Dropping the legacy columns needs SQLite >= 3.35 (found {version})")
+        product_ids = set(connection.execute(select(Product.id)).scalars())
+        addon_ids = set(connection.execute(select(Addon.id)).scalars())
+        existing = {tuple(row) for row in connection.execute(select(product_addon.c.product_id, product_addon.c.addon_id))}
+        for table, column, own_key, other_key in legacy:
+            for row_id, value in connection.execute(text(f'SELECT id, "{column}" FROM {table}')):
+                for other_id in json.loads(value or "[]"):
+                    link = {own_key: row_id, other_key: other_id}
+                    key = (link["product_id"], link["addon_id"])
+                    # Skip dangling ids and links already present from the other side
+                    if key in existing or key[0] not in product_ids or key[1] not in addon_ids:
+                        continue
+                    connection.execute(insert(product_addon).values(**link))
+                    existing.add(key)
+            connection.execute(text(f'ALTER TABLE {table} DROP COLUMN "{column}"'))
+
+def warm_pool():
+    """Open a few connections up front so the first requests don't pay connect cost;
+    the rest of the pool fills on demand"""
+    if isinstance(engine.pool, StaticPool):
+        return
+    connections = [engine.connect() for _ in range(min(POOL_SIZE, 4))]
+    for connection in connections:
+        connection.close()
+
+def bulk_create_products(db, rows):
+    """Insert many products in one executemany where the dialect supports it; each row may carry an applicableAddons id list.
+    Returns the new product ids in row order. The caller commits."""
+    rows = [dict(row) for row in rows]
+    addon_ids = [row.pop("applicableAddons", []) for row in rows]
+    if not rows:
+        return []
+    if db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+        product_ids = db.execute(
+            insert(Product).returning(Product.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+    else:
+        # Older SQLite without RETURNING: insert row by row to learn each new id
+        product_ids = [db.execute(insert(Product).values(**row)).inserted_primary_key[0] for row in rows]
+    # Repeated ids in one row would collide on the link table's primary key
+    links = [
+        {"product_id": product_id, "addon_id": addon_id}
+        for product_id, ids in zip(product_ids, addon_ids)
+        for addon_id in dict.fromkeys(ids)
+    ]
+    if links:
+        db.execute(insert(product_addon), links)
+    return product_ids
 
 
 
@@ -115,4 +257,11 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] != ["migrate"]:
+        sys.exit("usage: python database.py migrate")
+    create_schema()
+    migrate_applicable_json()
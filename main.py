@@ -1,52 +1,127 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
 import uvicorn
-import json, uuid
+import os
+import tempfile
+from secrets import token_hex
+import orjson
+import asyncio
+import anyio.to_thread
+from sqlalchemy import select, insert, update, bindparam, func, true, false
 from sqlalchemy.orm import Session
-from database import SessionLocal, Product, Addon, Event, Banner, Contact, Admin, Order, init_db
-from datetime import datetime, timedelta, timezone
+from database import engine, POOL_SIZE, MAX_OVERFLOW, SessionLocal, product_addon, Product, Addon, Event, Banner, Contact, Admin, Order, init_db, warm_pool, get_db, bulk_create_products
+from datetime import datetime
+from cache import cache_get, cache_set, cache_invalidate
 from auth import authenticate_admin, create_access_token, init_admin, verify_token
 from contextlib import asynccontextmanager
 from enum import Enum
 
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, use `python main.py` for several workers
+    fcntl = None
+
+_BOOTSTRAP_LOCK = os.path.join(tempfile.gettempdir(), "justreats-bootstrap.lock")
+
+def bootstrap():
+    """Create the schema and the default admin. Serialized across processes on this host,
+    so workers started by `uvicorn main:app --workers N` don't race on the DDL"""
+    with open(_BOOTSTRAP_LOCK, "w") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        init_db()
+        with SessionLocal() as db:
+            init_admin(db)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Initialize admin account at startup
-    db = next(get_db())
-    init_admin(db)
+    # Size the worker threadpool that runs the (synchronous) route handlers and bcrypt.
+    # Handlers hold a DB connection, so by default match the pool's capacity: extra threads
+    # would only block in the pool until pool_timeout instead of queueing up front.
+    # Tune THREADPOOL_SIZE together with DB_POOL_SIZE/DB_MAX_OVERFLOW
+    threadpool_size = int(os.getenv("THREADPOOL_SIZE", POOL_SIZE + MAX_OVERFLOW))
+    anyio.to_thread.current_default_thread_limiter().total_tokens = threadpool_size
+    # Create tables at startup rather than at import; the blocking DDL, admin bootstrap
+    # (bcrypt) and pool warm-up all run off the event loop. With several workers the
+    # parent has already bootstrapped before forking (see __main__)
+    if not os.getenv("DB_BOOTSTRAPPED"):
+        await asyncio.to_thread(bootstrap)
+    await asyncio.to_thread(warm_pool)
     yield
 
 app = FastAPI(
     title="JustTreats API", 
     description="API for managing cake and pastry orders",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
-# Initialize database
-init_db()
-
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# Enable CORS
+# Enable CORS; FRONTEND_URL takes a comma-separated list of allowed origins
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production, replace with your frontend URL
+    allow_origins=[origin.strip() for origin in os.getenv("FRONTEND_URL", "*").split(",") if origin.strip()],  # In production, set FRONTEND_URL to your frontend URL
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,  # Let browsers cache preflight responses for 24h
 )
 
-# Setup security
-security = HTTPBearer()
+# Compress larger JSON responses (list endpoints); level 5 balances CPU against ratio
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Orders keep items/customer as JSON strings; orjson encodes and decodes them
+def _dumps(value):
+    return orjson.dumps(value).decode()
+
+_loads = orjson.loads
+
+# Hot read statements, built once so executions hit the compiled-statement cache
+_GET_PRODUCT = select(Product).where(Product.id == bindparam("pid"))
+_GET_ADDON = select(Addon).where(Addon.id == bindparam("aid"))
+_GET_EVENT = select(Event).where(Event.id == bindparam("eid"))
+_GET_ADDONS_BY_IDS = select(Addon).where(Addon.id.in_(bindparam("ids", expanding=True)))
+_GET_PRODUCTS_BY_IDS = select(Product).where(Product.id.in_(bindparam("ids", expanding=True)))
+_GET_ORDER_BY_UNIQUE_ID = select(Order).where(Order.unique_order_id == bindparam("uid"))
+_GET_PRODUCT_PRICES = select(Product.id, Product.price).where(Product.id.in_(bindparam("ids", expanding=True)))
+_GET_ADDON_PRICES = select(Addon.id, Addon.price).where(Addon.id.in_(bindparam("ids", expanding=True)))
+
+# List endpoints select plain columns rather than hydrating ORM objects (and their relationships)
+_PRODUCT_COLUMNS = (Product.id, Product.name, Product.description, Product.price, Product.image,
+                    Product.available, Product.eventOnly, Product.eventId)
+_ADDON_COLUMNS = (Addon.id, Addon.name, Addon.description, Addon.price, Addon.available)
+_LIST_ADDONS = select(*_ADDON_COLUMNS)
+_GET_ADDON_ROWS_BY_IDS = select(*_ADDON_COLUMNS).where(Addon.id.in_(bindparam("ids", expanding=True)))
+_LIST_EVENTS = select(Event.id, Event.name, Event.description, Event.date, Event.endDate,
+                      Event.location, Event.image, Event.active, Event.featured)
+# Newest orders first, keyset-paginated on the primary key
+_LIST_ORDERS = select(Order.id, Order.date, Order.items, Order.customer, Order.total,
+                      Order.unique_order_id, Order.status).order_by(Order.id.desc()).limit(bindparam("n"))
+_LIST_ORDERS_BEFORE = _LIST_ORDERS.where(Order.id < bindparam("before_id"))
+_LIST_ADDON_LINKS = select(product_addon.c.product_id, product_addon.c.addon_id)
+_GET_LINKS_BY_PRODUCT_IDS = _LIST_ADDON_LINKS.where(product_addon.c.product_id.in_(bindparam("ids", expanding=True)))
+_GET_LINKS_BY_ADDON_IDS = _LIST_ADDON_LINKS.where(product_addon.c.addon_id.in_(bindparam("ids", expanding=True)))
+
+def _list_products_stmt(available: Optional[bool], keyset: bool):
+    stmt = select(*_PRODUCT_COLUMNS).order_by(Product.id).limit(bindparam("n"))
+    if available is not None:
+        # Render the flag as a literal so the planner can match the partial index on available rows
+        stmt = stmt.where(Product.available == (true() if available else false()))
+    if keyset:
+        stmt = stmt.where(Product.id > bindparam("after_id"))
+    else:
+        stmt = stmt.offset(bindparam("skip"))
+    return stmt
+
+# Product listing statements keyed by (available filter, keyset pagination)
+_LIST_PRODUCTS = {
+    (available, keyset): _list_products_stmt(available, keyset)
+    for available in (None, True, False)
+    for keyset in (True, False)
+}
 
 class ProductModel(BaseModel):
     id: Optional[int] = None
@@ -80,6 +155,10 @@ class EventModel(BaseModel):
     active: bool
     featured: bool
 
+# Product listing with its applicable addons embedded
+class ProductWithAddonsModel(ProductModel):
+    applicableAddons: List[AddonModel]
+
 # Banner Model
 class BannerModel(BaseModel):
     enabled: bool
@@ -133,6 +212,10 @@ class OrderModel(BaseModel):
     unique_order_id: Optional[str] = None
     status: Optional[str] = "ordered"
 
+class OrderPageModel(BaseModel):
+    items: List[OrderModel]
+    next_cursor: Optional[int] = None
+
 class StatusEnum(str, Enum):
     ordered = "ordered"
     received = "received"
@@ -142,8 +225,137 @@ class StatusEnum(str, Enum):
     paid = "paid"
     shipped = "shipped"
 
+def get_addons_by_ids(db: Session, addon_ids: List[int]):
+    addons = db.execute(_GET_ADDONS_BY_IDS, {"ids": addon_ids}).scalars().all()
+    missing = set(addon_ids) - {addon.id for addon in addons}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Addon with ID {min(missing)} not found")
+    return addons
+
+def get_products_by_ids(db: Session, product_ids: List[int]):
+    products = db.execute(_GET_PRODUCTS_BY_IDS, {"ids": product_ids}).scalars().all()
+    missing = set(product_ids) - {product.id for product in products}
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Product with ID {min(missing)} not found")
+    return products
+
+def group_links(links, key: int, value: int):
+    """Group (product_id, addon_id) link rows into {key column: sorted [value column]}"""
+    grouped = {}
+    for link in links:
+        grouped.setdefault(link[key], []).append(link[value])
+    for ids in grouped.values():
+        ids.sort()
+    return grouped
+
+def calculate_order_total(db: Session, items: List[OrderItem]):
+    """Price an order with one query for all its products and one for all its addons"""
+    product_ids = list({item.productId for item in items})
+    addon_ids = list({addon_item.addonId for item in items for addon_item in item.addons})
+    product_prices = dict(db.execute(_GET_PRODUCT_PRICES, {"ids": product_ids}).all()) if product_ids else {}
+    addon_prices = dict(db.execute(_GET_ADDON_PRICES, {"ids": addon_ids}).all()) if addon_ids else {}
+
+    total_price = 0
+    for item in items:
+        if item.productId not in product_prices:
+            raise HTTPException(status_code=404, detail=f"Product with ID {item.productId} not found")
+        total_price += product_prices[item.productId] * item.quantity
+
+        for addon_item in item.addons:
+            if addon_item.addonId not in addon_prices:
+                raise HTTPException(status_code=404, detail=f"Addon with ID {addon_item.addonId} not found")
+            total_price += addon_prices[addon_item.addonId] * addon_item.quantity
+    return total_price
+
+# Explicit column projections for ORM rows: no __dict__ copy (and so no _sa_instance_state),
+# and only the columns each response model declares are read. Link ids are sorted
+# to match the listings (group_links)
+def product_to_dict(product: Product):
+    return {
+        "id": product.id,
+        "name": product.name,
+        "description": product.description,
+        "price": product.price,
+        "image": product.image,
+        "available": product.available,
+        "applicableAddons": sorted(addon.id for addon in product.addons),
+        "eventOnly": product.eventOnly,
+        "eventId": product.eventId,
+    }
+
+def addon_to_dict(addon: Addon):
+    return {
+        "id": addon.id,
+        "name": addon.name,
+        "description": addon.description,
+        "price": addon.price,
+        "available": addon.available,
+        "applicableProducts": sorted(product.id for product in addon.products),
+    }
+
+def event_to_dict(event: Event):
+    return {
+        "id": event.id,
+        "name": event.name,
+        "description": event.description,
+        "date": event.date,
+        "endDate": event.endDate,
+        "location": event.location,
+        "image": event.image,
+        "active": event.active,
+        "featured": event.featured,
+    }
+
+def banner_to_dict(banner: Banner):
+    return {
+        "enabled": banner.enabled,
+        "imageUrl": banner.imageUrl,
+        "title": banner.title,
+        "description": banner.description,
+    }
+
+def contact_to_dict(contact: Contact):
+    return {
+        "instagram": contact.instagram,
+        "whatsapp": contact.whatsapp,
+        "email": contact.email,
+    }
+
+def order_model_from_row(order):
+    """Build an OrderModel from a stored order; the JSON columns hold data we validated
+    on write, so construct the models without validating again"""
+    items = [
+        OrderItem.model_construct(
+            productId=item_data["productId"],
+            quantity=item_data["quantity"],
+            addons=[OrderAddon.model_construct(**addon_data) for addon_data in item_data.get("addons", [])]
+        )
+        for item_data in _loads(order.items)
+    ]
+    return OrderModel.model_construct(
+        id=order.id,
+        date=order.date,
+        items=items,
+        customer=OrderCustomer.model_construct(**_loads(order.customer)),
+        total=order.total,
+        unique_order_id=order.unique_order_id,
+        status=order.status
+    )
+
+def update_by_id(db: Session, model, row_id: int, values: Dict[str, Any]):
+    """UPDATE a row by primary key and return it, in one round-trip where RETURNING is supported.
+    The row may already be in the session (e.g. selectin-loaded from the other side of a link),
+    so the returned values overwrite any loaded state."""
+    stmt = update(model).where(model.id == row_id).values(**values).execution_options(populate_existing=True)
+    if db.get_bind().dialect.update_returning:
+        return db.execute(stmt.returning(model)).scalar_one_or_none()
+    # Older SQLite without RETURNING: UPDATE, then load the row
+    if db.execute(stmt).rowcount == 0:
+        return None
+    return db.get(model, row_id, populate_existing=True)
+
 @app.post("/api/admin/login", response_model=AdminLoginResponse)
-async def admin_login(login_data: AdminLoginRequest, db: Session = Depends(get_db)):
+def admin_login(login_data: AdminLoginRequest, db: Session = Depends(get_db)):
     admin = authenticate_admin(db, login_data.username, login_data.password)
     if not admin:
         return AdminLoginResponse(
@@ -166,151 +378,196 @@ async def admin_login(login_data: AdminLoginRequest, db: Session = Depends(get_d
     )
 
 @app.post("/api/products", response_model=ProductModel)
-async def create_product(product: ProductModel, db: Session = Depends(get_db)):    
+def create_product(product: ProductModel, db: Session = Depends(get_db)):    
     # Validate eventId is provided when eventOnly is true
     if product.eventOnly and product.eventId is None:
         raise HTTPException(status_code=400, detail="eventId is required when eventOnly is true")
     
-    # Convert applicableAddons to JSON string
-    applicable_addons_json = json.dumps(product.applicableAddons)
-    
     db_product = Product(
         name=product.name,
         description=product.description,
         price=product.price,
         image=product.image,
         available=product.available,
-        applicableAddons=applicable_addons_json,
+        addons=get_addons_by_ids(db, product.applicableAddons),
         eventOnly=product.eventOnly,
         eventId=product.eventId
     )
     
     db.add(db_product)
     db.commit()
-    db.refresh(db_product)
-
-    return {**db_product.__dict__, "applicableAddons": json.loads(db_product.applicableAddons)}
+    cache_invalidate(*[("addon", addon.id) for addon in db_product.addons])
 
-@app.get("/api/products", response_model=List[ProductModel])
-async def get_products(available: Optional[bool] = None, page: int = 1, size: int = 10, db: Session = Depends(get_db)):
-    query = db.query(Product)
+    return product_to_dict(db_product)
 
-    if available is not None:
-        query = query.filter(Product.available == available)
+@app.post("/api/products/bulk", response_model=List[ProductModel])
+def bulk_import_products(products: List[ProductModel], token_data: Dict = Depends(verify_token), db: Session = Depends(get_db)):
+    # Validate eventId is provided when eventOnly is true
+    for product in products:
+        if product.eventOnly and product.eventId is None:
+            raise HTTPException(status_code=400, detail="eventId is required when eventOnly is true")
 
-    products = query.limit(size).offset((page - 1) * size)
+    # Check every referenced addon exists with a single query
+    addon_ids = sorted({addon_id for product in products for addon_id in product.applicableAddons})
+    get_addons_by_ids(db, addon_ids)
 
-    return [{**product.__dict__, "applicableAddons": json.loads(product.applicableAddons)} for product in products]
+    product_ids = bulk_create_products(db, [product.model_dump(exclude={"id"}) for product in products])
+    db.commit()
+    cache_invalidate(*[("addon", addon_id) for addon_id in addon_ids])
+
+    db_products = {product.id: product for product in db.execute(_GET_PRODUCTS_BY_IDS, {"ids": product_ids}).scalars()}
+    return [product_to_dict(db_products[product_id]) for product_id in product_ids]
+
+# List endpoints declare their shape via responses= so it stays in the OpenAPI schema,
+# and return ORJSONResponse so FastAPI doesn't re-encode and re-validate the output
+@app.get("/api/products", response_model=None, responses={200: {"model": Union[List[ProductModel], List[ProductWithAddonsModel]]}})
+def get_products(available: Optional[bool] = None, page: int = 1, size: int = 50, after_id: Optional[int] = None, include_addons: bool = False, db: Session = Depends(get_db)):
+    # Keyset pagination: clients pass the last id of the previous page as after_id.
+    # page is still honoured (via OFFSET) when after_id is not given.
+    if after_id is not None:
+        params = {"n": size, "after_id": after_id}
+    else:
+        params = {"n": size, "skip": (page - 1) * size}
+
+    rows = db.execute(_LIST_PRODUCTS[(available, after_id is not None)], params).all()
+    product_ids = [row.id for row in rows]
+    addons_of = group_links(db.execute(_GET_LINKS_BY_PRODUCT_IDS, {"ids": product_ids}).all(), 0, 1) if rows else {}
+    result = [{**row._mapping, "applicableAddons": addons_of.get(row.id, [])} for row in rows]
+
+    if include_addons:
+        # Fetch every addon referenced on this page once and embed it in place of its id
+        addon_ids = sorted({addon_id for ids in addons_of.values() for addon_id in ids})
+        addons_by_id = {}
+        if addon_ids:
+            products_of = group_links(db.execute(_GET_LINKS_BY_ADDON_IDS, {"ids": addon_ids}).all(), 1, 0)
+            for addon in db.execute(_GET_ADDON_ROWS_BY_IDS, {"ids": addon_ids}):
+                addons_by_id[addon.id] = {**addon._mapping, "applicableProducts": products_of.get(addon.id, [])}
+        for row in result:
+            row["applicableAddons"] = [addons_by_id[addon_id] for addon_id in row["applicableAddons"]]
+
+    return ORJSONResponse(result)
 
 @app.get("/api/products/{product_id}", response_model=ProductModel)
-async def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(Product).filter(Product.id == product_id).first()
+def get_product(product_id: int, db: Session = Depends(get_db)):
+    cached = cache_get(("product", product_id))
+    if cached is not None:
+        return cached
+    product = db.execute(_GET_PRODUCT, {"pid": product_id}).scalar_one_or_none()
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return {**product.__dict__, "applicableAddons": json.loads(product.applicableAddons)}
+    result = product_to_dict(product)
+    cache_set(("product", product_id), result)
+    return result
 
 @app.put("/api/products/{product_id}", response_model=ProductModel)
-async def update_product(product_id: int, updated_product: ProductModel, db: Session = Depends(get_db)):
-    db_product = db.query(Product).filter(Product.id == product_id).first()
-    if db_product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
+def update_product(product_id: int, updated_product: ProductModel, db: Session = Depends(get_db)):
     # Validate eventId is provided when eventOnly is true
     if updated_product.eventOnly and updated_product.eventId is None:
         raise HTTPException(status_code=400, detail="eventId is required when eventOnly is true")
     
-    # Update product fields
-    for field, value in updated_product.model_dump().items():
-        if field == "id":
-            continue
-        if field == "applicableAddons":
-            value = json.dumps(value)
-        setattr(db_product, field, value)
+    addons = get_addons_by_ids(db, updated_product.applicableAddons)
+
+    # Update product fields with a single UPDATE ... RETURNING
+    db_product = update_by_id(db, Product, product_id, updated_product.model_dump(exclude={"id", "applicableAddons"}))
+    if db_product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
     
+    # Addons linked before and after the update both see a changed applicableProducts
+    stale_keys = [("product", product_id)] + [("addon", addon.id) for addon in db_product.addons + addons]
+    db_product.addons = addons
+
+    result = product_to_dict(db_product)
     db.commit()
-    db.refresh(db_product)
-    return {**db_product.__dict__, "applicableAddons": json.loads(db_product.applicableAddons)}
+    cache_invalidate(*stale_keys)
+    return result
 
 @app.delete("/api/products/{product_id}")
-async def delete_product(product_id: int, db: Session = Depends(get_db)):
-    db_product = db.query(Product).filter(Product.id == product_id).first()
+def delete_product(product_id: int, db: Session = Depends(get_db)):
+    db_product = db.get(Product, product_id)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    stale_keys = [("product", product_id)] + [("addon", addon.id) for addon in db_product.addons]
     db.delete(db_product)
     db.commit()
+    cache_invalidate(*stale_keys)
     return {"message": "Product deleted successfully"}
 
 # Addon Endpoints
 @app.post("/api/addons", response_model=AddonModel)
-async def create_addon(addon: AddonModel, db: Session = Depends(get_db)):
+def create_addon(addon: AddonModel, db: Session = Depends(get_db)):
     # Check if addon with same ID already exists
-    db_addon = db.query(Addon).filter(Addon.id == addon.id).first()
-    if db_addon:
+    if addon.id is not None and db.get(Addon, addon.id) is not None:
         raise HTTPException(status_code=400, detail="Addon with this ID already exists")
     
-    # Convert applicableProducts to JSON string
-    applicable_products_json = json.dumps(addon.applicableProducts)
-    
     db_addon = Addon(
         name=addon.name,
         description=addon.description,
         price=addon.price,
         available=addon.available,
-        applicableProducts=applicable_products_json
+        products=get_products_by_ids(db, addon.applicableProducts)
     )
     
     db.add(db_addon)
     db.commit()
-    db.refresh(db_addon)
-    return {**db_addon.__dict__, "applicableProducts": json.loads(db_addon.applicableProducts)}
+    cache_invalidate(*[("product", product.id) for product in db_addon.products])
+    return addon_to_dict(db_addon)
 
-@app.get("/api/addons", response_model=List[AddonModel])
-async def get_addons(db: Session = Depends(get_db)):
-    addons = db.query(Addon).all()
-    return [{**addon.__dict__, "applicableProducts": json.loads(addon.applicableProducts)} for addon in addons]
+@app.get("/api/addons", response_model=None, responses={200: {"model": List[AddonModel]}})
+def get_addons(db: Session = Depends(get_db)):
+    products_of = group_links(db.execute(_LIST_ADDON_LINKS).all(), 1, 0)
+    return ORJSONResponse([
+        {**addon._mapping, "applicableProducts": products_of.get(addon.id, [])}
+        for addon in db.execute(_LIST_ADDONS)
+    ])
 
 @app.get("/api/addons/{addon_id}", response_model=AddonModel)
-async def get_addon(addon_id: int, db: Session = Depends(get_db)):
-    addon = db.query(Addon).filter(Addon.id == addon_id).first()
+def get_addon(addon_id: int, db: Session = Depends(get_db)):
+    cached = cache_get(("addon", addon_id))
+    if cached is not None:
+        return cached
+    addon = db.execute(_GET_ADDON, {"aid": addon_id}).scalar_one_or_none()
     if addon is None:
         raise HTTPException(status_code=404, detail="Addon not found")
-    return {**addon.__dict__, "applicableProducts": json.loads(addon.applicableProducts)}
+    result = addon_to_dict(addon)
+    cache_set(("addon", addon_id), result)
+    return result
 
 @app.put("/api/addons/{addon_id}", response_model=AddonModel)
-async def update_addon(addon_id: int, updated_addon: AddonModel, db: Session = Depends(get_db)):
-    db_addon = db.query(Addon).filter(Addon.id == addon_id).first()
+def update_addon(addon_id: int, updated_addon: AddonModel, db: Session = Depends(get_db)):
+    products = get_products_by_ids(db, updated_addon.applicableProducts)
+
+    # Update addon fields with a single UPDATE ... RETURNING
+    db_addon = update_by_id(db, Addon, addon_id, updated_addon.model_dump(exclude={"id", "applicableProducts"}))
     if db_addon is None:
         raise HTTPException(status_code=404, detail="Addon not found")
     
-    # Update addon fields
-    for field, value in updated_addon.model_dump().items():
-        if field == "id":
-            continue
-        if field == "applicableProducts":
-            value = json.dumps(value)
-        setattr(db_addon, field, value)
-    
+    # Products linked before and after the update both see a changed applicableAddons
+    stale_keys = [("addon", addon_id)] + [("product", product.id) for product in db_addon.products + products]
+    db_addon.products = products
+
+    result = addon_to_dict(db_addon)
     db.commit()
-    db.refresh(db_addon)
-    return {**db_addon.__dict__, "applicableProducts": json.loads(db_addon.applicableProducts)}
+    cache_invalidate(*stale_keys)
+    return result
 
 @app.delete("/api/addons/{addon_id}")
-async def delete_addon(addon_id: int, db: Session = Depends(get_db)):
-    db_addon = db.query(Addon).filter(Addon.id == addon_id).first()
+def delete_addon(addon_id: int, db: Session = Depends(get_db)):
+    db_addon = db.get(Addon, addon_id)
     if db_addon is None:
         raise HTTPException(status_code=404, detail="Addon not found")
     
+    stale_keys = [("addon", addon_id)] + [("product", product.id) for product in db_addon.products]
     db.delete(db_addon)
     db.commit()
+    cache_invalidate(*stale_keys)
     return {"message": "Addon deleted successfully"}
 
 # Event Endpoints
 @app.post("/api/events", response_model=EventModel)
-async def create_event(event: EventModel, db: Session = Depends(get_db)):
+def create_event(event: EventModel, db: Session = Depends(get_db)):
     # Check if event with same ID already exists
-    db_event = db.query(Event).filter(Event.id == event.id).first()
-    if db_event:
+    if event.id is not None and db.get(Event, event.id) is not None:
         raise HTTPException(status_code=400, detail="Event with this ID already exists")
     
     # Validate endDate is after date
@@ -330,61 +587,70 @@ async def create_event(event: EventModel, db: Session = Depends(get_db)):
     
     db.add(db_event)
     db.commit()
-    db.refresh(db_event)
     return db_event
 
-@app.get("/api/events", response_model=List[EventModel])
-async def get_events(db: Session = Depends(get_db)):
-    events = db.query(Event).all()
-    return events
+@app.get("/api/events", response_model=None, responses={200: {"model": List[EventModel]}})
+def get_events(db: Session = Depends(get_db)):
+    return ORJSONResponse([dict(event._mapping) for event in db.execute(_LIST_EVENTS)])
 
 @app.get("/api/events/{event_id}", response_model=EventModel)
-async def get_event(event_id: int, db: Session = Depends(get_db)):
-    event = db.query(Event).filter(Event.id == event_id).first()
+def get_event(event_id: int, db: Session = Depends(get_db)):
+    cached = cache_get(("event", event_id))
+    if cached is not None:
+        return cached
+    event = db.execute(_GET_EVENT, {"eid": event_id}).scalar_one_or_none()
     if event is None:
         raise HTTPException(status_code=404, detail="Event not found")
-    return event
+    result = event_to_dict(event)
+    cache_set(("event", event_id), result)
+    return result
 
 @app.put("/api/events/{event_id}", response_model=EventModel)
-async def update_event(event_id: int, updated_event: EventModel, db: Session = Depends(get_db)):
-    db_event = db.query(Event).filter(Event.id == event_id).first()
-    if db_event is None:
-        raise HTTPException(status_code=404, detail="Event not found")
-    
+def update_event(event_id: int, updated_event: EventModel, db: Session = Depends(get_db)):
     # Validate endDate is after date
     if updated_event.endDate <= updated_event.date:
         raise HTTPException(status_code=400, detail="endDate must be after date")
     
-    # Update event fields
-    for field, value in updated_event.model_dump().items():
-        if field == "id":
-            continue
-        setattr(db_event, field, value)
+    # Update event fields with a single UPDATE ... RETURNING
+    db_event = update_by_id(db, Event, event_id, updated_event.model_dump(exclude={"id"}))
+    if db_event is None:
+        raise HTTPException(status_code=404, detail="Event not found")
     
+    result = event_to_dict(db_event)
     db.commit()
-    db.refresh(db_event)
-    return db_event
+    cache_invalidate(("event", event_id))
+    return result
 
 @app.delete("/api/events/{event_id}")
-async def delete_event(event_id: int, db: Session = Depends(get_db)):
-    db_event = db.query(Event).filter(Event.id == event_id).first()
+def delete_event(event_id: int, db: Session = Depends(get_db)):
+    db_event = db.get(Event, event_id)
     if db_event is None:
         raise HTTPException(status_code=404, detail="Event not found")
     
     db.delete(db_event)
     db.commit()
+    cache_invalidate(("event", event_id))
     return {"message": "Event deleted successfully"}
 
+def _json_bytes_response(content: bytes):
+    return Response(content=content, media_type="application/json")
+
 # Banner Endpoints
+# The banner and contact singletons are cached as pre-encoded JSON bytes and replaced on PUT
 @app.get("/api/banner", response_model=BannerModel)
-async def get_banner(db: Session = Depends(get_db)):
+def get_banner(db: Session = Depends(get_db)):
+    cached = cache_get(("banner",))
+    if cached is not None:
+        return _json_bytes_response(cached)
     banner = db.query(Banner).first()
     if banner is None:
         raise HTTPException(status_code=404, detail="Banner configuration not found")
-    return banner
+    content = orjson.dumps(banner_to_dict(banner))
+    cache_set(("banner",), content)
+    return _json_bytes_response(content)
 
 @app.put("/api/banner", response_model=BannerModel)
-async def update_banner(banner_config: BannerModel, db: Session = Depends(get_db)):
+def update_banner(banner_config: BannerModel, db: Session = Depends(get_db)):
     # Check if banner config exists
     db_banner = db.query(Banner).first()
     
@@ -405,19 +671,25 @@ async def update_banner(banner_config: BannerModel, db: Session = Depends(get_db
         db_banner.description = banner_config.description
     
     db.commit()
-    db.refresh(db_banner)
-    return db_banner
+    content = orjson.dumps(banner_to_dict(db_banner))
+    cache_set(("banner",), content)
+    return _json_bytes_response(content)
 
 # Contact Endpoints
 @app.get("/api/contact", response_model=ContactModel)
-async def get_contact(db: Session = Depends(get_db)):
+def get_contact(db: Session = Depends(get_db)):
+    cached = cache_get(("contact",))
+    if cached is not None:
+        return _json_bytes_response(cached)
     contact = db.query(Contact).first()
     if contact is None:
         raise HTTPException(status_code=404, detail="Contact configuration not found")
-    return contact
+    content = orjson.dumps(contact_to_dict(contact))
+    cache_set(("contact",), content)
+    return _json_bytes_response(content)
 
 @app.put("/api/contact", response_model=ContactModel)
-async def update_contact(contact_config: ContactModel, db: Session = Depends(get_db)):
+def update_contact(contact_config: ContactModel, db: Session = Depends(get_db)):
     # Check if contact config exists
     db_contact = db.query(Contact).first()
     
@@ -436,184 +708,111 @@ async def update_contact(contact_config: ContactModel, db: Session = Depends(get
         db_contact.email = contact_config.email
     
     db.commit()
-    db.refresh(db_contact)
-    return db_contact
+    content = orjson.dumps(contact_to_dict(db_contact))
+    cache_set(("contact",), content)
+    return _json_bytes_response(content)
 
 # Order Endpoints
 @app.post("/api/orders", response_model=OrderModel)
-async def create_order(order: OrderModel, db: Session = Depends(get_db)):
-    # Set the current date
-    current_date = datetime.now(timezone.utc)
-    
+def create_order(order: OrderModel, db: Session = Depends(get_db)):
     # Calculate total price by fetching product and addon details
-    total_price = 0
-    
-    # Process each item in the order
-    for item in order.items:
-        # Get the product
-        product = db.query(Product).filter(Product.id == item.productId).first()
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product with ID {item.productId} not found")
-        
-        # Add product price to total
-        total_price += product.price * item.quantity
-        
-        # Process addons for this item
-        for addon_item in item.addons:
-            # Get the addon
-            addon = db.query(Addon).filter(Addon.id == addon_item.addonId).first()
-            if not addon:
-                raise HTTPException(status_code=404, detail=f"Addon with ID {addon_item.addonId} not found")
-            
-            # Add addon price to total
-            total_price += addon.price * addon_item.quantity
-    
-    # Create new order
-    db_order = Order(
-        date=current_date,
-        items=json.dumps([item.model_dump() for item in order.items]),
-        customer=json.dumps(order.customer.model_dump()),
+    total_price = calculate_order_total(db, order.items)
+    
+    # Create new order with a single INSERT ... RETURNING for the generated columns.
+    # The database stamps the date; it is set explicitly because orders tables created
+    # before the server default was added have no DEFAULT on the column
+    unique_order_id = token_hex(16)
+    stmt = insert(Order).values(
+        date=func.now(),
+        items=_dumps([item.model_dump() for item in order.items]),
+        customer=_dumps(order.customer.model_dump()),
         total=total_price,
-        unique_order_id=uuid.uuid4().hex
+        unique_order_id=unique_order_id
     )
-    
-    db.add(db_order)
+    if db.get_bind().dialect.insert_returning:
+        created = db.execute(stmt.returning(Order.id, Order.date, Order.status)).one()
+    else:
+        # Older SQLite without RETURNING: INSERT, then read the generated columns back
+        order_id = db.execute(stmt).inserted_primary_key[0]
+        created = db.execute(select(Order.id, Order.date, Order.status).where(Order.id == order_id)).one()
     db.commit()
-    db.refresh(db_order)
     
-    # Prepare the response
-    return OrderModel(
-        id=db_order.id,
-        date=db_order.date,
+    # Prepare the response; the request body was already validated
+    return OrderModel.model_construct(
+        id=created.id,
+        date=created.date,
         items=order.items,
         customer=order.customer,
-        total=db_order.total,
-        unique_order_id=db_order.unique_order_id,
-        status=db_order.status
+        total=total_price,
+        unique_order_id=unique_order_id,
+        status=created.status
     )
 
 @app.put("/api/orders/unique/{order_id}", response_model=OrderModel)
-async def update_order_by_unique_id(order_id: str, updated_order: OrderModel, db: Session = Depends(get_db)):
-    db_order = db.query(Order).filter(Order.unique_order_id == order_id).first()
+def update_order_by_unique_id(order_id: str, updated_order: OrderModel, db: Session = Depends(get_db)):
+    db_order = db.execute(_GET_ORDER_BY_UNIQUE_ID, {"uid": order_id}).scalar_one_or_none()
     if db_order is None:
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Calculate total price by fetching product and addon details
-    total_price = 0
-    
-    # Process each item in the order
-    for item in updated_order.items:
-        # Get the product
-        product = db.query(Product).filter(Product.id == item.productId).first()
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product with ID {item.productId} not found")
-        
-        # Add product price to total
-        total_price += product.price * item.quantity
-        
-        # Process addons for this item
-        for addon_item in item.addons:
-            # Get the addon
-            addon = db.query(Addon).filter(Addon.id == addon_item.addonId).first()
-            if not addon:
-                raise HTTPException(status_code=404, detail=f"Addon with ID {addon_item.addonId} not found")
-            
-            # Add addon price to total
-            total_price += addon.price * addon_item.quantity
+    total_price = calculate_order_total(db, updated_order.items)
     
     # Update the order data
-    db_order.items = json.dumps([item.model_dump() for item in updated_order.items])
-    db_order.customer = json.dumps(updated_order.customer.model_dump())
+    db_order.items = _dumps([item.model_dump() for item in updated_order.items])
+    db_order.customer = _dumps(updated_order.customer.model_dump())
     db_order.total = total_price
     if updated_order.status:
         db_order.status = updated_order.status
     
     db.commit()
-    db.refresh(db_order)
     
     # Return the updated order including the potentially updated status
-    # Load the updated order from the database to ensure consistency
-    items_data = json.loads(db_order.items)
-    customer_data = json.loads(db_order.customer)
-    items = [OrderItem(**item_data) for item_data in items_data]
-    customer = OrderCustomer(**customer_data)
-
-    return OrderModel(
-        id=db_order.id,
-        date=db_order.date,
-        items=items,
-        customer=customer,
-        total=db_order.total,
-        unique_order_id=db_order.unique_order_id,
-        status=db_order.status
-    )
+    return order_model_from_row(db_order)
 
 @app.get("/api/orders/unique/{unique_order_id}", response_model=OrderModel)
-async def get_order_by_unique_id(unique_order_id: str, db: Session = Depends(get_db)):
-    order = db.query(Order).filter(Order.unique_order_id == unique_order_id).first()
+def get_order_by_unique_id(unique_order_id: str, db: Session = Depends(get_db)):
+    order = db.execute(_GET_ORDER_BY_UNIQUE_ID, {"uid": unique_order_id}).scalar_one_or_none()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
-    items_data = json.loads(order.items)
-    customer_data = json.loads(order.customer)
-    items = [OrderItem(**item_data) for item_data in items_data]
-    customer = OrderCustomer(**customer_data)
-
-    return OrderModel(
-        id=order.id,
-        date=order.date,
-        items=items,
-        customer=customer,
-        total=order.total,
-        unique_order_id=order.unique_order_id,
-        status=order.status
-    )
+    return order_model_from_row(order)
 
-@app.get("/api/orders", response_model=List[OrderModel])
-async def get_orders(token_data: Dict = Depends(verify_token), db: Session = Depends(get_db)):
+@app.get("/api/orders", response_model=None, responses={200: {"model": OrderPageModel}})
+def get_orders(limit: int = Query(100, ge=1, le=500), before_id: Optional[int] = None, token_data: Dict = Depends(verify_token), db: Session = Depends(get_db)):
     # Authentication is handled by the verify_token dependency
     
-    orders = db.query(Order).all()
+    # Clients pass next_cursor from the previous page as before_id; it is null on the last page
+    if before_id is not None:
+        orders = db.execute(_LIST_ORDERS_BEFORE, {"n": limit, "before_id": before_id}).all()
+    else:
+        orders = db.execute(_LIST_ORDERS, {"n": limit}).all()
     
-    # Convert the orders from database format to response format
-    result = []
-    for order in orders:
-        # Parse the JSON strings
-        items_data = json.loads(order.items)
-        customer_data = json.loads(order.customer)
-        
-        # Convert items data to OrderItem objects
-        items = []
-        for item_data in items_data:
-            # Convert addons data to OrderAddon objects
-            addons = []
-            for addon_data in item_data.get("addons", []):
-                addons.append(OrderAddon(**addon_data))
-            
-            # Create OrderItem with its addons
-            items.append(OrderItem(
-                productId=item_data["productId"],
-                quantity=item_data["quantity"],
-                addons=addons
-            ))
-        
-        # Create OrderCustomer object
-        customer = OrderCustomer(**customer_data)
-        
-        # Create complete OrderModel
-        result.append(OrderModel(
-            id=order.id,
-            date=order.date,
-            items=items,
-            customer=customer,
-            total=order.total,
-            unique_order_id=order.unique_order_id,
-            status=order.status
-        ))
+    # The JSON columns were written from validated models, so decode them straight into the response
+    result = [
+        {**order._mapping, "items": _loads(order.items), "customer": _loads(order.customer)}
+        for order in orders
+    ]
+    next_cursor = orders[-1].id if len(orders) == limit else None
     
-    return result
+    return ORJSONResponse({"items": result, "next_cursor": next_cursor})
 
 if __name__ == "__main__":
-    import os
     reload = os.environ["ENV"] == "dev"
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=reload) 
\ No newline at end of file
+    # One process per core in production; reload mode only supports a single worker
+    workers = 1 if reload else os.cpu_count() or 1
+    if workers > 1:
+        # Set up once here rather than having every worker take the bootstrap lock
+        # in turn, and have their lifespans skip it
+        bootstrap()
+        engine.dispose()
+        os.environ["DB_BOOTSTRAPPED"] = "1"
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=reload,
+        loop="uvloop",
+        http="httptools",
+        workers=workers,
+        access_log=reload,
+    ) 
\ No newline at end of file